@@ -2,22 +2,32 @@
 Elite Personal Finance Chatbot - Colorful Trendy UI
 
 Run:
-1. pip install streamlit pandas numpy plotly python-dateutil
+1. pip install streamlit pandas numpy plotly python-dateutil pyarrow
 2. streamlit run app_trendy_full.py
 """
 
-import os, time
+import html, os, re, time, uuid
 import streamlit as st
 import pandas as pd
 import numpy as np
 from datetime import datetime
 from dateutil import parser
 import plotly.express as px
-import textwrap
+import pyarrow as pa
+from pyarrow import csv as pacsv
 
 # -----------------------
 # Helper Functions
 # -----------------------
+def normalize_transactions(df):
+    # Categorical/Arrow columns keep groupbys on int codes; dates become naive UTC seconds
+    df['date'] = pd.to_datetime(df['date'], utc=True).dt.tz_convert(None).astype('datetime64[s]')
+    df['category'] = df['category'].astype('category')
+    if 'description' in df.columns:
+        df['description'] = df['description'].astype('string[pyarrow]')
+    df['amount'] = df['amount'].astype('float64')
+    return df
+
 def load_sample_transactions():
     data = [
         {"date": "2025-08-01", "category": "Food", "amount": 250, "description": "Lunch"},
@@ -29,62 +39,136 @@ def load_sample_transactions():
         {"date": "2025-08-15", "category": "Savings", "amount": -5000, "description": "Monthly saving transfer"},
         {"date": "2025-08-20", "category": "Investment", "amount": -2000, "description": "SIP"},
     ]
-    df = pd.DataFrame(data)
-    df['date'] = pd.to_datetime(df['date'])
-    return df
+    return normalize_transactions(pd.DataFrame(data))
 
 def parse_transactions(uploaded_file):
-    df = pd.read_csv(uploaded_file)
+    # Arrow's multi-threaded reader; category comes back already dictionary-encoded.
+    # date/amount stay inferred so non-ISO dates and stray text still go through
+    # the coercion below and in normalize_transactions
+    # Ragged rows are rejected by Arrow, so those files go through pandas instead
+    try:
+        table = pacsv.read_csv(uploaded_file,
+            parse_options=pacsv.ParseOptions(newlines_in_values=True),
+            convert_options=pacsv.ConvertOptions(
+                column_types={'category': pa.dictionary(pa.int32(), pa.string()), 'description': pa.string()},
+                strings_can_be_null=True))
+        df = table.to_pandas()
+    except pa.ArrowInvalid:
+        uploaded_file.seek(0)
+        df = pd.read_csv(uploaded_file)
     required = {'date','category','amount'}
     if not required.issubset(df.columns):
         raise ValueError(f"CSV must contain at least columns: {required}")
-    df['date'] = pd.to_datetime(df['date'])
     df['amount'] = pd.to_numeric(df['amount'], errors='coerce')
-    return df.dropna(subset=['amount','date'])
+    return normalize_transactions(df.dropna(subset=['amount','date']))
+
+def _category_sums(df, abs_values=False, mask=None):
+    # Equivalent to groupby('category', observed=True, sort=False)['amount'].sum():
+    # unobserved categories are dropped and the groups are never sorted
+    cat = df['category']
+    if isinstance(cat.dtype, pd.CategoricalDtype):
+        codes, cats = cat.cat.codes.to_numpy(), np.asarray(cat.cat.categories)
+    else:
+        codes, cats = pd.factorize(cat, sort=False)
+        cats = np.asarray(cats)
+    valid = codes >= 0 if mask is None else (codes >= 0) & mask
+    sums = np.bincount(codes[valid], weights=df['amount'].to_numpy(dtype='float64')[valid], minlength=len(cats))
+    seen = np.bincount(codes[valid], minlength=len(cats)) > 0
+    if abs_values: sums = np.abs(sums)
+    return cats[seen], sums[seen]
+
+def _top_k(cats, sums, k):
+    # argpartition picks the k largest in O(G); only those k get sorted
+    if len(sums)==0: return []
+    k = min(k, len(sums))
+    idx = np.argpartition(-sums, k-1)[:k]
+    idx = idx[np.argsort(-sums[idx], kind='stable')]
+    return list(zip(cats[idx], sums[idx]))
+
+def _top_k_by_category(df, k, abs_values=False, mask=None):
+    return _top_k(*_category_sums(df, abs_values, mask), k)
+
+# Keys are per-session version tokens, so entries are bounded to keep a
+# long-running server from accumulating one set per session/Add-Tx forever
+_CACHE_MAX_ENTRIES = 256
+
+@st.cache_data(show_spinner=False, max_entries=_CACHE_MAX_ENTRIES)
+def _agg_by_cat(tx_key, _transactions):
+    # Full-frame signed totals per category, shared by insights and the chart
+    cats, sums = _category_sums(_transactions)
+    return pd.Series(sums, index=cats, name='amount')
 
-def summarize_budget(transactions):
+def summarize_budget(transactions, tx_key, agg_by_cat=None):
+    return _summarize_budget_impl(tx_key, transactions, agg_by_cat)
+
+@st.cache_data(show_spinner=False, max_entries=_CACHE_MAX_ENTRIES)
+def _summarize_budget_impl(tx_key, _transactions, _agg_by_cat=None):
+    transactions = _transactions
     if transactions.empty: return "No transactions to summarize."
-    tx = transactions.copy()
-    recent = tx[tx['date']>= tx['date'].max() - pd.Timedelta(days=30)]
-    if recent.empty: recent = tx
-    total_spent = recent[recent['amount']>0]['amount'].sum()
-    total_saved = -recent[recent['amount']<0]['amount'].sum()
-    by_cat = recent.groupby('category')['amount'].sum().sort_values(ascending=False)
+    # Window filter, split sums and category totals all run on the raw column arrays
+    dates = transactions['date'].to_numpy()
+    dmax = dates.max()
+    mask = dates >= dmax - np.timedelta64(30, 'D')
+    if not mask.any(): mask[:] = True
+    amt = transactions['amount'].to_numpy(dtype='float64')[mask]
+    total_spent = amt[amt>0].sum()
+    total_saved = abs(amt[amt<0].sum())
+    dmin, dmax = pd.Timestamp(dates[mask].min()), pd.Timestamp(dmax)
+    days = max(1,(dmax-dmin).days)
+    if _agg_by_cat is not None and mask.all():
+        top_cats = _top_k(_agg_by_cat.index.to_numpy(), _agg_by_cat.to_numpy(), 5)
+    else:
+        top_cats = _top_k_by_category(transactions, 5, mask=mask)
     lines = [
-        f"**Period:** {recent['date'].min().date()} → {recent['date'].max().date()}",
+        f"**Period:** {dmin.date()} → {dmax.date()}",
         f"**Total Spending:** ₹{total_spent:,.2f}",
         f"**Total Savings/Investments:** ₹{total_saved:,.2f}",
         "**Top Expense Categories:**"
     ]
-    for cat, amt in by_cat[by_cat>0].head(5).items():
+    for cat, amt in top_cats:
+        if amt<=0: break
         lines.append(f"- {cat}: ₹{amt:,.2f}")
-    avg_daily = total_spent / max(1,(recent['date'].max()-recent['date'].min()).days)
+    avg_daily = total_spent / days
     lines.append(f"**Avg Daily Spend:** ₹{avg_daily:,.2f}")
-    suggested_monthly = total_spent * 30 / max(1,(recent['date'].max()-recent['date'].min()).days) * 0.9
+    suggested_monthly = total_spent * 30 / days * 0.9
     lines.append(f"**Suggested Monthly Budget:** ₹{suggested_monthly:,.0f} (~10% reduction)")
     return "\n".join(lines)
 
-def generate_spending_insights(transactions, profile):
+def generate_spending_insights(transactions, profile, tx_key, agg_by_cat=None):
+    if agg_by_cat is None: agg_by_cat = _agg_by_cat(tx_key, transactions)
+    # Only user_type is read, so name/age/income edits don't invalidate the cache
+    return _spending_insights_impl(tx_key, transactions, profile.get('user_type'), agg_by_cat)
+
+@st.cache_data(show_spinner=False, max_entries=_CACHE_MAX_ENTRIES)
+def _spending_insights_impl(tx_key, _transactions, user_type, _agg_by_cat):
+    transactions = _transactions
     if transactions.empty: return "No transactions to analyze."
-    by_cat = transactions.groupby('category')['amount'].sum().abs().sort_values(ascending=False)
-    top = by_cat.head(3)
-    total = transactions['amount'].abs().sum()
-    top_pct = (top/total*100).round(1)
+    cats, sums = _agg_by_cat.index.to_numpy(), np.abs(_agg_by_cat.to_numpy())
+    by_cat = dict(zip(cats, sums))
+    top = _top_k(cats, sums, 3)
+    total = np.abs(transactions['amount'].to_numpy(dtype='float64')).sum()
+    pcts = np.round(np.array([amt for _,amt in top])/total*100, 1)
     suggestions = ["**Top Spending Categories:**"]
-    for i,(cat,amt) in enumerate(top.items(),1):
-        suggestions.append(f"{i}. {cat} — ₹{amt:,.0f} (~{top_pct.iloc[i-1]}%)")
-    if 'Subscriptions' in by_cat.index and by_cat['Subscriptions']>500:
+    suggestions.extend(f"{i}. {cat} — ₹{amt:,.0f} (~{pct}%)" for i,((cat,amt),pct) in enumerate(zip(top, pcts),1))
+    if by_cat.get('Subscriptions', 0)>500:
         suggestions.append("- Consider reviewing unused subscriptions.")
-    if 'Food' in by_cat.index and by_cat['Food']>2000:
+    if by_cat.get('Food', 0)>2000:
         suggestions.append("- Set weekly limits for dining out.")
-    if 'Transport' in by_cat.index and by_cat['Transport']>1000:
+    if by_cat.get('Transport', 0)>1000:
         suggestions.append("- Explore travel cards or carpooling.")
-    if profile.get('user_type')=='Student':
+    if user_type=='Student':
         suggestions.append("- Build emergency buffer (₹2k–₹10k).")
     else:
         suggestions.append("- Automate savings and tax-saving investments.")
     return "\n".join(suggestions)
 
+@st.cache_data(show_spinner=False, max_entries=_CACHE_MAX_ENTRIES)
+def _insight_fig(tx_key, _agg_by_cat):
+    top = _top_k(_agg_by_cat.index.to_numpy(), np.abs(_agg_by_cat.to_numpy()), 8)
+    cats, vals = [cat for cat,_ in top], np.array([amt for _,amt in top])
+    return px.bar(x=cats, y=vals, labels={'x':'Category','y':'Amount (₹)'},
+                  title="Top Expense Categories", color=vals, color_continuous_scale='Agsunset')
+
 def generate_tax_guidance(profile):
     base = ["**Tax Guidance (general educational):**"]
     if profile.get('user_type')=='Student':
@@ -99,14 +183,29 @@ def format_response_for_tone(text, profile, complexity="Auto"):
     user_type = profile.get('user_type','Student')
     if complexity=="Auto": complexity = "Simple" if user_type=="Student" else "Detailed"
     prefix = "Hey! Here's a simple version:\n\n" if complexity=="Simple" else "Hello — advisory:\n\n"
-    return prefix + textwrap.fill(text, width=80)
-
-def local_ai_response(msg, profile, transactions, complexity):
-    m = msg.lower()
-    if "budget" in m: return summarize_budget(transactions)
-    if any(k in m for k in ["spend","insights","save"]): return generate_spending_insights(transactions, profile)
-    if "tax" in m: return generate_tax_guidance(profile)
-    if any(k in m for k in ["invest","sip"]): return ("General investment advice:\n- Emergency fund\n- Diversified equity/index funds\n- Short-term: liquid funds or FDs")
+    # Line breaks are kept; _chat_body_html turns them into <br>
+    return prefix + text
+
+_BOLD_RE = re.compile(r'\*\*(.+?)\*\*')
+
+def _chat_body_html(text):
+    # Chat bubbles are raw HTML, so replies are turned into HTML here: escaped
+    # (they echo CSV/user input), **bold** kept, newlines as <br>. With no blank
+    # lines left, each bubble stays one HTML block in the joined history
+    body = _BOLD_RE.sub(r'<strong>\1</strong>', html.escape(text, quote=False))
+    return body.replace("\n", "<br>")
+
+_INTENT_RE = re.compile(r'(?P<budget>budget)|(?P<insights>spend|insights|save)|(?P<tax>tax)|(?P<invest>invest|sip)', re.I)
+_INTENT_PRIORITY = ("budget", "insights", "tax", "invest")
+
+def local_ai_response(msg, profile, transactions, complexity, tx_key, agg_by_cat=None):
+    # One regex pass collects every intent; the earliest in _INTENT_PRIORITY wins
+    found = {m.lastgroup for m in _INTENT_RE.finditer(msg)}
+    kind = next((k for k in _INTENT_PRIORITY if k in found), None)
+    if kind=="budget": return summarize_budget(transactions, tx_key, agg_by_cat)
+    if kind=="insights": return generate_spending_insights(transactions, profile, tx_key, agg_by_cat)
+    if kind=="tax": return generate_tax_guidance(profile)
+    if kind=="invest": return ("General investment advice:\n- Emergency fund\n- Diversified equity/index funds\n- Short-term: liquid funds or FDs")
     return "I can assist with budget, spending insights, tax basics, or investment tips."
 
 # -----------------------
@@ -139,53 +238,73 @@ with st.sidebar:
     use_sample = st.checkbox("Use sample transactions", True)
 
 # Transactions
+def _bump_tx_version():
+    # Cache key for every write to the frame; st.cache_data is shared across
+    # sessions, so versions must be globally unique rather than a per-session count
+    st.session_state['_tx_version'] = uuid.uuid4().hex
+
 if 'transactions' not in st.session_state:
     if uploaded:
         try: st.session_state['transactions']=parse_transactions(uploaded)
         except: st.session_state['transactions']=load_sample_transactions()
     else:
-        st.session_state['transactions']=load_sample_transactions() if use_sample else pd.DataFrame(columns=['date','category','amount','description'])
-transactions = st.session_state['transactions']
+        st.session_state['transactions']=load_sample_transactions() if use_sample else normalize_transactions(pd.DataFrame(columns=['date','category','amount','description']))
+    _bump_tx_version()
+elif '_tx_version' not in st.session_state:
+    _bump_tx_version()
+st.session_state.setdefault('_tx_buffer', [])
 
-# Tabs
-tab1, tab2, tab3, tab4 = st.tabs(["💰 Budget","📊 Insights","🧾 Tax","➕ Add Tx"])
+def _materialized_tx():
+    # Added rows are buffered and folded in with one concat per render
+    buf = st.session_state['_tx_buffer']
+    if buf:
+        # Only the new rows are normalized; unifying the category dictionaries
+        # first keeps the concat from decaying the column back to object
+        df, new = st.session_state['transactions'], normalize_transactions(pd.DataFrame(buf))
+        cats = df['category'].cat.categories.union(new['category'].cat.categories, sort=False)
+        df['category'] = df['category'].cat.set_categories(cats)
+        new['category'] = new['category'].cat.set_categories(cats)
+        st.session_state['transactions'] = pd.concat([df, new], ignore_index=True)
+        st.session_state['_tx_buffer'] = []
+        _bump_tx_version()
+    return st.session_state['transactions']
 
-# -----------------------
-# Budget Tab
-# -----------------------
-with tab1:
+transactions = _materialized_tx()
+tx_key = st.session_state['_tx_version']
+agg_by_cat = _agg_by_cat(tx_key, transactions)
+
+# Profile lives in session state and is only replaced when a sidebar field changes
+profile = {"name": name, "user_type": user_type, "age": age, "monthly_income": monthly_income}
+if st.session_state.get('profile') != profile:
+    st.session_state['profile'] = profile
+profile = st.session_state['profile']
+
+# The Add-Tx tab and the chat panel own forms, so they are fragments and a submit
+# only reruns its own block; the display-only tabs are plain functions
+def _budget_tab(transactions, agg_by_cat, tx_key):
     st.subheader("📋 Budget Summary")
-    summary = summarize_budget(transactions)
+    summary = summarize_budget(transactions, tx_key, agg_by_cat)
     st.markdown(summary)
 
-# -----------------------
-# Insights Tab
-# -----------------------
-with tab2:
+def _insights_tab(transactions, profile, agg_by_cat, tx_key):
     st.subheader("📊 Spending Insights")
-    profile = {"name": name, "user_type": user_type, "age": age, "monthly_income": monthly_income}
-    insights = generate_spending_insights(transactions, profile)
+    if transactions.empty:
+        st.info("Upload a CSV or enable sample data.")
+        return
+    insights = generate_spending_insights(transactions, profile, tx_key, agg_by_cat)
     st.markdown(insights)
-    
+
     # Plotly bar chart for categories
-    if not transactions.empty:
-        agg = transactions.groupby('category')['amount'].sum().abs().sort_values(ascending=False)
-        fig = px.bar(agg.head(8), x=agg.head(8).index, y=agg.head(8).values, labels={'x':'Category','y':'Amount (₹)'},
-                     title="Top Expense Categories", color=agg.head(8).values, color_continuous_scale='Agsunset')
-        st.plotly_chart(fig, use_container_width=True)
+    fig = _insight_fig(tx_key, agg_by_cat)
+    st.plotly_chart(fig, use_container_width=True)
 
-# -----------------------
-# Tax Tab
-# -----------------------
-with tab3:
+def _tax_tab(profile):
     st.subheader("🧾 Tax Guidance")
     guidance = generate_tax_guidance(profile)
     st.markdown(guidance)
 
-# -----------------------
-# Add Transaction Tab
-# -----------------------
-with tab4:
+@st.fragment
+def _add_tx_tab():
     st.subheader("➕ Add Transaction")
     with st.form("add_tx"):
         d = st.date_input("Date", value=datetime.today())
@@ -195,9 +314,62 @@ with tab4:
         add_sub = st.form_submit_button("Add Transaction")
         if add_sub:
             new = {"date": pd.to_datetime(d), "category": cat, "amount": float(amt), "description": desc}
-            st.session_state['transactions'] = pd.concat([st.session_state['transactions'], pd.DataFrame([new])], ignore_index=True)
+            st.session_state['_tx_buffer'].append(new)
             st.success("Transaction added.")
-            st.experimental_rerun()
+            # New data affects every tab, so this one needs a full-app rerun
+            st.rerun()
+
+@st.fragment
+def _chat_panel(transactions, profile, complexity, agg_by_cat, tx_key):
+    # History is drawn into a placeholder after the form is handled, so a new
+    # message shows up without another rerun
+    history = st.empty()
+
+    # Chat input
+    with st.form("chat_form", clear_on_submit=True):
+        user_input = st.text_input("Type your message here...")
+        submitted = st.form_submit_button("Send")
+        if submitted and user_input:
+            st.session_state['messages'].append({"role":"user","text":user_input})
+            resp_text = local_ai_response(user_input, profile, transactions, complexity, tx_key, agg_by_cat)
+            resp_text = format_response_for_tone(resp_text, profile, complexity)
+            st.session_state['messages'].append({"role":"assistant","text":resp_text})
+
+    # Display chat
+    # One markdown element for the whole history
+    chat_html = "".join(
+        f"<div style='background:linear-gradient(90deg,#ab47bc,#6a1b9a);padding:10px;border-radius:12px;margin:5px;color:white;'>{_chat_body_html(msg['text'])}</div>"
+        if msg['role']=="assistant" else
+        f"<div style='background:#f1f0f0;padding:10px;border-radius:12px;margin:5px;color:black;'>You: {_chat_body_html(msg['text'])}</div>"
+        for msg in st.session_state['messages'])
+    history.markdown(chat_html, unsafe_allow_html=True)
+
+# Tabs
+tab1, tab2, tab3, tab4 = st.tabs(["💰 Budget","📊 Insights","🧾 Tax","➕ Add Tx"])
+
+# -----------------------
+# Budget Tab
+# -----------------------
+with tab1:
+    _budget_tab(transactions, agg_by_cat, tx_key)
+
+# -----------------------
+# Insights Tab
+# -----------------------
+with tab2:
+    _insights_tab(transactions, profile, agg_by_cat, tx_key)
+
+# -----------------------
+# Tax Tab
+# -----------------------
+with tab3:
+    _tax_tab(profile)
+
+# -----------------------
+# Add Transaction Tab
+# -----------------------
+with tab4:
+    _add_tx_tab()
 
 # -----------------------
 # Chat Interface
@@ -206,20 +378,5 @@ st.markdown("---")
 st.subheader("💬 Chat with your Finance Assistant")
 if 'messages' not in st.session_state:
     st.session_state['messages'] = [{"role":"assistant","text":"Hi! I'm your Personal Finance Assistant. Ask me about budget, spending, tax, or investment tips."}]
-
-# Display chat
-for msg in st.session_state['messages']:
-    if msg['role']=="assistant": st.markdown(f"<div style='background:linear-gradient(90deg,#ab47bc,#6a1b9a);padding:10px;border-radius:12px;margin:5px;color:white;'>{msg['text']}</div>", unsafe_allow_html=True)
-    else: st.markdown(f"<div style='background:#f1f0f0;padding:10px;border-radius:12px;margin:5px;color:black;'>You: {msg['text']}</div>", unsafe_allow_html=True)
-
-# Chat input
-with st.form("chat_form", clear_on_submit=True):
-    user_input = st.text_input("Type your message here...")
-    submitted = st.form_submit_button("Send")
-    if submitted and user_input:
-        st.session_state['messages'].append({"role":"user","text":user_input})
-        resp_text = local_ai_response(user_input, profile, transactions, complexity)
-        resp_text = format_response_for_tone(resp_text, profile, complexity)
-        st.session_state['messages'].append({"role":"assistant","text":resp_text})
-        st.experimental_rerun()
+_chat_panel(transactions, profile, complexity, agg_by_cat, tx_key)
 # End of app.py
\ No newline at end of file